@@ -1,15 +1,19 @@
 import asyncio
 import logging
+import typing as tp
 from os import getenv
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.types.callback_query import CallbackQuery
+from aiolimiter import AsyncLimiter
 
 from vocab_bot.engine import VocabBotEngine
+from vocab_bot.utils import LruCache
 
 logging.getLogger().setLevel(logging.WARNING)
 
@@ -21,30 +25,58 @@ engine = VocabBotEngine(
 )
 dp = Dispatcher()
 
+# Telegram allows bots to send about 30 messages per second in total.
+limiter = AsyncLimiter(29, 1.0)
+MAX_SEND_ATTEMPTS = 3
+# Payload hashes of screens shown in messages, by (chat_id, message_id). Used to skip edits
+# that wouldn't change the message (Telegram rejects them with "message is not modified").
+shown_screens = LruCache(10000)  # type: LruCache[tuple[int, int], bytes]
+
+
+async def send(request: tp.Callable[[], tp.Awaitable[tp.Any]]) -> tp.Any:
+    """Makes a request to Telegram API, respecting the rate limit. Returns its result."""
+    for attempt in range(MAX_SEND_ATTEMPTS):
+        async with limiter:
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                if attempt == MAX_SEND_ATTEMPTS - 1:
+                    raise
+                logging.warning("Rate limited by Telegram, retrying in %d s", e.retry_after)
+                retry_after = e.retry_after
+        await asyncio.sleep(retry_after)
+
 
 @dp.callback_query()
 async def callback_handler(query: CallbackQuery) -> None:
     user_id = query.from_user.id
-    screen = engine.respond_to_button(user_id, query.data)
+    screen = await engine.respond_to_button_async(user_id, query.data)
     if screen is not None:
-        await query.message.edit_text(screen.get_message_text(), reply_markup=screen.get_markup())
+        key = (query.message.chat.id, query.message.message_id)
+        payload_hash = screen.payload_hash()
+        if shown_screens.get(key) != payload_hash:
+            await send(lambda: query.message.edit_text(
+                screen.get_message_text(), reply_markup=screen.get_markup()))
+            shown_screens.put(key, payload_hash)
     else:
-        await query.message.answer("Unknown error. Click /start to start again.")
+        await send(lambda: query.message.answer("Unknown error. Click /start to start again."))
 
 
 @dp.message(Command('help'))
 async def command_help(message: Message) -> None:
-    await message.answer(engine.create_help_screen().get_message_text())
+    await send(lambda: message.answer(engine.help_text))
 
 
 @dp.message()
 async def default_message_handler(message: types.Message) -> None:
     user = message.from_user
-    screen = engine.respond_default(user.id, user.username)
+    screen = await engine.respond_default_async(user.id, user.username)
     if screen is not None:
-        await message.answer(screen.get_message_text(), reply_markup=screen.get_markup())
+        sent = await send(lambda: message.answer(
+            screen.get_message_text(), reply_markup=screen.get_markup()))
+        shown_screens.put((sent.chat.id, sent.message_id), screen.payload_hash())
     else:
-        await message.answer("Unknown error. Click /start to start again.")
+        await send(lambda: message.answer("Unknown error. Click /start to start again."))
 
 
 async def main() -> None:
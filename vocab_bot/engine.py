@@ -1,12 +1,21 @@
-import copy
+import asyncio
+import contextvars
 import csv
+import functools
+import itertools
 import logging
+import os
+import pickle
 import random
+import threading
 import typing as tp
-from dataclasses import dataclass
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from .storage import VocabBotStorage, ItemLearnState, UserStorageInfo
+from .storage import VocabBotStorage, VocabState, UserStorageInfo
 from .user_screens import (Question, SessionSummary, HomeScreen, VocabSelect, MessageBox,
                            UserScreen, HelpScreen)
 from .utils import get_cur_time, secs_to_interval
@@ -16,10 +25,11 @@ from .utils import get_cur_time, secs_to_interval
 NUM_BOXES = 5
 WAIT_TIMES_HR = [0, 1 * 24, 7 * 24, 16 * 24, 1000000]
 MAX_VOCAB_SIZE = 3000
+# Bump when Vocab or VocabItem changes, to invalidate pickled vocabs.
+VOCAB_CACHE_VERSION = 1
 
 
-@dataclass(frozen=True)
-class VocabItem:
+class VocabItem(tp.NamedTuple):
     foreign: str  # 1st column in CSV.
     native: str  # 2nd column in CSV.
     extra_info: tp.Optional[str]  # Pronunciation, or anything else (3rd optional column in CSV).
@@ -30,31 +40,79 @@ class Vocab:
     id: str
     items: list[VocabItem]
     private_user_ids: tp.Optional[set[int]]
+    # Columns of items, for fast access by index.
+    foreign: tuple[str, ...] = field(init=False, repr=False, compare=False)
+    native: tuple[str, ...] = field(init=False, repr=False, compare=False)
+    extra_info: tuple[tp.Optional[str], ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'foreign', tuple(item.foreign for item in self.items))
+        object.__setattr__(self, 'native', tuple(item.native for item in self.items))
+        object.__setattr__(self, 'extra_info', tuple(item.extra_info for item in self.items))
+
+    @staticmethod
+    def _read_csv_rows(csvfile: tp.TextIO) -> tp.Iterator[list[str]]:
+        """Parses CSV, skipping empty lines. Most lines are split without csv module."""
+        for line in csvfile:
+            if '"' in line:
+                # Quoted values may contain commas and line breaks, let csv module parse them.
+                yield next(csv.reader(itertools.chain([line], csvfile)))
+                continue
+            line = line.rstrip('\r\n')
+            if len(line) > 0:
+                yield line.split(',')
 
     @staticmethod
     def load_from_csv(id: str, path: Path):
         items = []  # type: list[VocabItem]
         private_user_ids = None
         with open(path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                assert 2 <= len(row) <= 3
-                if row[0] == "__private_user_ids__":
-                    private_user_ids = set(int(uid) for uid in row[1].split(","))
-                    continue
-                elif row[0].startswith("__"):
-                    continue
-                native = row[1].strip()
-                if "," in native:
-                    synonyms = [w.strip() for w in native.split(",")]
-                    native = ",".join(synonyms[:3])
-                extra_info = None if len(row) == 2 else row[2]
-                assert len(row[0]) > 0 and len(native) > 0, "Bad row: %s" % row
-                items.append(VocabItem(foreign=row[0], native=native, extra_info=extra_info))
+            rows = list(Vocab._read_csv_rows(csvfile))
+        for row in rows:
+            assert 2 <= len(row) <= 3, "Bad row: %s" % row
+            if row[0] == "__private_user_ids__":
+                private_user_ids = set(int(uid) for uid in row[1].split(","))
+                continue
+            elif row[0].startswith("__"):
+                continue
+            native = row[1].strip()
+            if "," in native:
+                synonyms = [w.strip() for w in native.split(",")]
+                native = ",".join(synonyms[:3])
+            extra_info = None if len(row) == 2 else row[2]
+            assert len(row[0]) > 0 and len(native) > 0, "Bad row: %s" % row
+            items.append(VocabItem(foreign=row[0], native=native, extra_info=extra_info))
         assert len(items) <= MAX_VOCAB_SIZE, "Vocab %s is too large (%d > %d)." % (
             id, len(items), MAX_VOCAB_SIZE)
         return Vocab(id=id, items=items, private_user_ids=private_user_ids)
 
+    @staticmethod
+    def load(id: str, path: Path):
+        """Loads vocab from CSV file, using pickled copy next to it if it's up to date."""
+        cache_path = path.with_suffix(".pkl")
+        stat = path.stat()
+        key = (VOCAB_CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(cache_path, "rb") as f:
+                # Key is checked before unpickling the vocab, which may fail if it's stale.
+                if pickle.load(f) == key:
+                    return pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.warning("Can't read vocab cache %s", cache_path, exc_info=True)
+
+        vocab = Vocab.load_from_csv(id, path)
+        tmp_path = cache_path.with_suffix(".pkl.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(vocab, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            logging.warning("Can't write vocab cache %s", cache_path)
+        return vocab
+
     def get_items(self, idxs: tp.Sequence[int]) -> list[VocabItem]:
         return [self.items[idx] for idx in idxs]
 
@@ -74,7 +132,7 @@ class LearningSession:
     def __init__(self, user_vocab: 'UserVocab', items_idx: list[int]):
         self.user_vocab = user_vocab
         self.items_idx = items_idx
-        self.not_answered = copy.copy(items_idx)
+        self.not_answered = list(items_idx)
         self.wrong_guesses = set()  # type: set[int]
         self.quest_prompt = ""
         self.quest_correct_answer = ""
@@ -103,36 +161,21 @@ class LearningSession:
         prev_correct_answer = self.quest_correct_answer
         prev_extra_info = self.quest_extra_info
 
-        self.quest_item_idx = random.choice(self.not_answered)
-        var_num = self.user_vocab.engine.variants_num
-        if len(self.items_idx) >= var_num:
-            variants = random.sample(self.items_idx, var_num)
-        else:
-            variants = copy.copy(self.items_idx)
-            total_words = len(self.user_vocab.state)
-            while len(variants) < var_num:
-                idx = random.randint(0, total_words - 1)
-                if idx not in variants:
-                    variants.append(idx)
-        if self.quest_item_idx not in variants:
-            variants[0] = self.quest_item_idx
-        random.shuffle(variants)
-        assert len(variants) == var_num
-        self.quest_correct_option = variants.index(self.quest_item_idx)
+        self.quest_item_idx, variants, self.quest_correct_option = self._draw_question(
+            self.not_answered)
 
         # Generate prompt and responses.
         question_dir = random.randint(0, 1)  # foreign->native or other way around.
-        items = self.user_vocab.vocab.items
+        vocab = self.user_vocab.vocab
         if question_dir == 0:
-            prompt = items[self.quest_item_idx].foreign
-            options = [items[i].native for i in variants]
-            self.quest_correct_answer = items[self.quest_item_idx].native
+            prompts, answers = vocab.foreign, vocab.native
         else:
-            prompt = items[self.quest_item_idx].native
-            options = [items[i].foreign for i in variants]
-            self.quest_correct_answer = items[self.quest_item_idx].foreign
+            prompts, answers = vocab.native, vocab.foreign
+        prompt = prompts[self.quest_item_idx]
+        options = [answers[i] for i in variants]
+        self.quest_correct_answer = answers[self.quest_item_idx]
         self.quest_prompt = prompt
-        self.quest_extra_info = self.user_vocab.vocab.items[self.quest_item_idx].extra_info
+        self.quest_extra_info = vocab.extra_info[self.quest_item_idx]
         return Question(prompt=prompt,
                         options=options,
                         prev_correct=self.prev_correct,
@@ -140,6 +183,23 @@ class LearningSession:
                         prev_correct_answer=prev_correct_answer,
                         prev_extra_info=prev_extra_info)
 
+    def _draw_question(self, candidates: list[int]) -> tuple[int, list[int], int]:
+        """Picks item to ask about, answer variants and index of the correct variant."""
+        item_idx = random.choice(candidates)
+        var_num = self.user_vocab.engine.variants_num
+        if len(self.items_idx) >= var_num:
+            variants = random.sample(self.items_idx, var_num)
+        else:
+            # Not enough words in session, take variants from the whole vocab.
+            variants = random.sample(range(len(self.user_vocab.state)), var_num)
+        # Variants are in random order, so the correct one can replace any of them.
+        if item_idx in variants:
+            correct_option = variants.index(item_idx)
+        else:
+            correct_option = random.randrange(var_num)
+            variants[correct_option] = item_idx
+        return item_idx, variants, correct_option
+
     def finalize(self) -> SessionSummary:
         """Save session results and generate summary."""
         assert self.done()
@@ -148,23 +208,25 @@ class LearningSession:
         incorrect_count = 0
         box_move_summary = dict()  # type: dict[str, list[str]]
         cur_time = get_cur_time()
-        vocab = self.user_vocab.vocab.items
+        foreign = self.user_vocab.vocab.foreign
+        boxes = self.user_vocab.state.box
+        next_show = self.user_vocab.state.next_show_time_sec
         for idx in self.items_idx:
-            state = self.user_vocab.state[idx]
-            box_before = state.box
+            box_before = boxes[idx]
             if idx in self.wrong_guesses:
                 incorrect_count += 1
-                state.box = max(box_before - 1, 0)
+                box = max(box_before - 1, 0)
             else:
                 correct_count += 1
-                state.box = min(box_before + 1, NUM_BOXES - 1)
-            state.next_show_time_sec = cur_time + WAIT_TIMES_HR[state.box] * 3600
-            move_type = f"{box_before}->{state.box}"
-            if state.box > box_before:
+                box = min(box_before + 1, NUM_BOXES - 1)
+            boxes[idx] = box
+            next_show[idx] = cur_time + WAIT_TIMES_HR[box] * 3600
+            move_type = f"{box_before}->{box}"
+            if box > box_before:
                 move_type = "⬆️" + move_type
-            elif state.box < box_before:
+            elif box < box_before:
                 move_type = "⬇️" + move_type
-            word = vocab[idx].foreign
+            word = foreign[idx]
             if move_type in box_move_summary:
                 box_move_summary[move_type].append(word)
             else:
@@ -183,14 +245,13 @@ class UserVocab:
     engine: 'VocabBotEngine'
     user_id: int
     vocab: Vocab
-    state: list[ItemLearnState]
+    state: VocabState
     session: tp.Optional[LearningSession] = None
     wait_time_sec = 0  # Set in case user needs to wait.
 
     def compute_summary(self):
-        box_cnt = [0 for _ in range(NUM_BOXES)]
-        for item in self.state:
-            box_cnt[item.box] += 1
+        boxes = self.state.box.tobytes()
+        box_cnt = [boxes.count(i) for i in range(NUM_BOXES)]
         progress = sum(i * box_cnt[i] for i in range(NUM_BOXES))
         total = len(self.state) * (NUM_BOXES - 1)
         summary = "/".join(map(str, box_cnt))
@@ -202,45 +263,51 @@ class UserVocab:
 
     def fully_learned(self):
         last_box = NUM_BOXES - 1
-        return all(s.box >= last_box for s in self.state)
+        return min(self.state.box) >= last_box
 
     def start_session(self):
         # Select words that are ready for review. Prefer higher boxes.
         cur_time = get_cur_time()
-        ready_idx_by_box = [[] for _ in range(NUM_BOXES)]
-        ready_cnt = 0
-        for i, state in enumerate(self.state):
-            if state.next_show_time_sec <= cur_time:
-                ready_idx_by_box[state.box].append(i)
-                ready_cnt += 1
-        idx = []
+        times = self.state.next_show_time_sec
+        ready = [i for i, t in enumerate(times) if t <= cur_time]
+        if len(ready) == 0:
+            self.wait_time_sec = min(times) - cur_time
+            self.session = None
+            return
+        ready_cnt = len(ready)
+        boxes = self.state.box
         ss = self.engine.session_size
-        for i in range(NUM_BOXES - 1, -1, -1):
-            if len(idx) == ss:
-                break
-            assert len(idx) < ss
-            if len(idx) + len(ready_idx_by_box[i]) <= ss:
-                idx += ready_idx_by_box[i]
-            else:
-                cnt = ss - len(idx)
-                idx += random.sample(ready_idx_by_box[i], cnt)
+        if ready_cnt <= ss:
+            # All ready words fit into the session, no need to group them by box.
+            idx = sorted(ready, key=boxes.__getitem__, reverse=True)
+        else:
+            ready_idx_by_box = [[] for _ in range(NUM_BOXES)]
+            for i in ready:
+                ready_idx_by_box[boxes[i]].append(i)
+            idx = []
+            for i in range(NUM_BOXES - 1, -1, -1):
+                if len(idx) == ss:
+                    break
+                assert len(idx) < ss
+                if len(idx) + len(ready_idx_by_box[i]) <= ss:
+                    idx += ready_idx_by_box[i]
+                else:
+                    cnt = ss - len(idx)
+                    idx += random.sample(ready_idx_by_box[i], cnt)
         assert len(idx) == min(ss, ready_cnt)
 
         # Don't show synonyms in the same session
         words = set()
         idx2 = []
+        foreign, native = self.vocab.foreign, self.vocab.native
         for i in idx:
-            item = self.vocab.items[i]
-            if not (item.foreign in words or item.native in words):
+            if not (foreign[i] in words or native[i] in words):
                 idx2.append(i)
-                words.add(item.foreign)
-                words.add(item.native)
+                words.add(foreign[i])
+                words.add(native[i])
 
-        if len(idx2) > 0:
-            self.session = LearningSession(self, idx2)
-        else:
-            self.wait_time_sec = min(s.next_show_time_sec for s in self.state) - cur_time
-            self.session = None
+        assert len(idx2) > 0
+        self.session = LearningSession(self, idx2)
 
     def save(self):
         """Saves learning state to storage."""
@@ -253,14 +320,21 @@ class VocabBotEngine:
                  db_path: Path = Path('./data/vocab_bot_db.sqlite'),
                  vocabs_dir: Path = Path('./data/vocab_bot_vocabs'),
                  session_size: int = 20,
-                 variants_num: int = 5):
+                 variants_num: int = 5,
+                 sync_workers: tp.Optional[int] = None,
+                 max_active_sessions: int = 10000):
         # Number of words in one learning session.
         self.session_size = session_size
         # Number of answer variants for a question.
         self.variants_num = variants_num
         assert self.session_size >= self.variants_num
 
-        self.storage = VocabBotStorage(db_path)
+        # Blocking work (SQLite I/O) for async callers runs in a thread pool, so it doesn't
+        # block the event loop. Default size is the same as for ThreadPoolExecutor.
+        if sync_workers is None:
+            sync_workers = min(32, (os.cpu_count() or 1) + 4)
+        # One read connection per worker thread, so reading threads never wait for each other.
+        self.storage = VocabBotStorage(db_path, read_pool_size=sync_workers)
 
         # Load all vocabs.
         self.vocabs = dict()  # type: dict[str, Vocab]
@@ -270,14 +344,41 @@ class VocabBotEngine:
             if not vocab_file.is_file() or not file_name.endswith(".csv"):
                 continue
             vocab_id = file_name[:-4]
-            vocab = Vocab.load_from_csv(vocab_id, vocab_file)
+            vocab = Vocab.load(vocab_id, vocab_file)
             assert len(vocab.items) >= self.variants_num
             self.vocabs[vocab_id] = vocab
         assert len(self.vocabs) > 0, "No vocabs found in %s" % vocabs_dir
         print("Loaded %d vocabs." % len(self.vocabs))
 
-        # Sessions.
-        self.active_vocabs = dict()  # type: dict[int, UserVocab]
+        # Help screen depends only on settings, so it's rendered once.
+        self.help_screen = HelpScreen(session_size=self.session_size)
+        self.help_text = self.help_screen.get_message_text()
+
+        # Sessions, least recently used first. When there are more than max_active_sessions,
+        # least recently used sessions (most likely abandoned) are dropped.
+        self.max_active_sessions = max_active_sessions
+        self.active_vocabs = OrderedDict()  # type: OrderedDict[int, UserVocab]
+        self.active_vocabs_lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=sync_workers,
+                                           thread_name_prefix="vocab_bot")
+        # Locks serializing async requests of each user. Used only on event loop thread. A lock
+        # is dropped when no request holds or waits for it.
+        self.user_locks: tp.MutableMapping[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+        # Handlers for callbacks "<action>:<arg>".
+        self.button_handlers = {
+            "ans": self._handle_answer,
+            "select_vocab": self._handle_select_vocab,
+            "goto": self._handle_goto,
+        }  # type: dict[str, tp.Callable[[int, str], tp.Optional[UserScreen]]]
+        # Handlers for callbacks "goto:<target>".
+        self.goto_handlers = {
+            "home": self.create_home_screen,
+            "select_vocab": self.create_vocab_select_screen,
+            "help": lambda user: self.create_help_screen(),
+            "session": self._start_session,
+        }  # type: dict[str, tp.Callable[[UserStorageInfo], tp.Optional[UserScreen]]]
 
     def get_user_vocab(self, user_id: int, vocab_id: str) -> tp.Optional[UserVocab]:
         """Loads vocab. Creates it if it doesn't exist."""
@@ -286,7 +387,7 @@ class VocabBotEngine:
             assert vocab_id in self.vocabs
             vocab = self.vocabs[vocab_id]
             num_items = len(vocab.items)
-            state = [ItemLearnState.new() for _ in range(num_items)]
+            state = VocabState.new(num_items)
             result = UserVocab(engine=self, user_id=user_id, vocab=vocab, state=state)
             result.save()
             return result
@@ -295,75 +396,129 @@ class VocabBotEngine:
             return UserVocab(
                 engine=self, user_id=user_id, vocab=self.vocabs[vocab_id], state=state)
 
+    async def _run_in_executor(self, user_id: int, func: tp.Callable[..., tp.Any], *args):
+        """Runs func(*args) in executor, holding the lock of given user.
+
+        The lock is taken on event loop, so requests waiting for it don't occupy worker threads.
+        """
+        lock = self.user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.user_locks[user_id] = lock
+        async with lock:
+            ctx = contextvars.copy_context()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(ctx.run, func, *args))
+
+    async def respond_to_button_async(
+            self, user_id: int, callback_data: str) -> tp.Optional[UserScreen]:
+        """Same as respond_to_button, but doesn't block the event loop."""
+        return await self._run_in_executor(
+            user_id, self.respond_to_button, user_id, callback_data)
+
+    async def respond_default_async(self, user_id: int, name: str) -> UserScreen:
+        """Same as respond_default, but doesn't block the event loop."""
+        return await self._run_in_executor(user_id, self.respond_default, user_id, name)
+
+    def _get_active_vocab(self, user_id: int) -> tp.Optional[UserVocab]:
+        with self.active_vocabs_lock:
+            user_vocab = self.active_vocabs.get(user_id)
+            if user_vocab is not None:
+                self.active_vocabs.move_to_end(user_id)
+            return user_vocab
+
+    def _set_active_vocab(self, user_id: int, user_vocab: UserVocab) -> None:
+        with self.active_vocabs_lock:
+            self.active_vocabs[user_id] = user_vocab
+            self.active_vocabs.move_to_end(user_id)
+            while len(self.active_vocabs) > self.max_active_sessions:
+                evicted_user_id, _ = self.active_vocabs.popitem(last=False)
+                logging.info("Dropped inactive session of user %d", evicted_user_id)
+
+    def _remove_active_vocab(self, user_id: int) -> None:
+        with self.active_vocabs_lock:
+            self.active_vocabs.pop(user_id, None)
+
     def respond_to_button(self, user_id: int, callback_data: str) -> tp.Optional[UserScreen]:
-        args = callback_data.split(":")
-        if len(args) != 2:
-            logging.warning("Bad callback:", callback_data)
+        action, sep, arg = callback_data.partition(":")
+        handler = self.button_handlers.get(action)
+        if handler is None or sep == "":
+            logging.warning("Bad callback: %s", callback_data)
             return None
+        return handler(user_id, arg)
+
+    def _handle_answer(self, user_id: int, arg: str) -> tp.Optional[UserScreen]:
+        """Answer to question within session."""
+        try:
+            option = int(arg)
+        except ValueError:
+            logging.warning("Bad callback: ans:%s", arg)
+            return None
+        user_vocab = self._get_active_vocab(user_id)
+        if user_vocab is None:
+            logging.warning("User %d doesn't have active vocab.", user_id)
+            return None
+        if user_vocab.session is None:
+            logging.warning("User %d doesn't have active session.", user_id)
+            return None
+        user_vocab.session.answer_question(option)
+        if user_vocab.session.done():
+            response = user_vocab.session.finalize()
+            self._remove_active_vocab(user_id)
+            return response
+        else:
+            return user_vocab.session.next_question()
 
-        # Answer to question within session.
-        if args[0] == "ans":
-            option = int(args[1])
-            if user_id not in self.active_vocabs:
-                logging.warning("User %d doesn't have active vocab.", user_id)
-                return None
-            user_vocab = self.active_vocabs[user_id]
-            if user_vocab.session is None:
-                logging.warning("User %d doesn't have active session.", user_id)
-                return None
-            user_vocab.session.answer_question(option)
-            if user_vocab.session.done():
-                response = user_vocab.session.finalize()
-                del self.active_vocabs[user_id]
-                return response
-            else:
-                return user_vocab.session.next_question()
-
+    def _get_user(self, user_id: int) -> tp.Optional[UserStorageInfo]:
         user = self.storage.get_user(user_id)
         if user is None:
             logging.warning("User not found: %d", user_id)
-            logging.warning("User not found: %d", user_id)
-            return None
+        return user
 
-        # Switching vocab.
-        if args[0] == "select_vocab":
-            vocab_id = args[1]
-            if vocab_id not in self.vocabs:
-                return None
-            if not self.vocabs[vocab_id].is_visible(user_id):
-                return None
-            user.active_vocab = vocab_id
+    def _handle_select_vocab(self, user_id: int, vocab_id: str) -> tp.Optional[UserScreen]:
+        """Switching vocab."""
+        user = self._get_user(user_id)
+        if user is None:
+            return None
+        if vocab_id not in self.vocabs:
+            return None
+        if not self.vocabs[vocab_id].is_visible(user_id):
+            return None
+        user.active_vocab = vocab_id
+        with self.storage.transaction():
             self.storage.update_user(user)
-            self.get_user_vocab(user_id, vocab_id)  # Creates vocab if it doesn't exist.
-            return self.create_home_screen(user)
+            # Summary exists iff vocab exists, and unlike the state it's usually cached.
+            if self.storage.get_vocab_summary(user_id, vocab_id) is None:
+                self.get_user_vocab(user_id, vocab_id)  # Creates vocab.
+        return self.create_home_screen(user)
+
+    def _handle_goto(self, user_id: int, target: str) -> tp.Optional[UserScreen]:
+        handler = self.goto_handlers.get(target)
+        if handler is None:
+            logging.warning("Unrecognized callback: goto:%s", target)
+            return None
+        user = self._get_user(user_id)
+        if user is None:
+            return None
+        return handler(user)
 
-        elif args[0] == "goto":
-            if args[1] == "home":
-                return self.create_home_screen(user)
-            elif args[1] == "select_vocab":
-                return self.create_vocab_select_screen(user)
-            elif args[1] == "help":
-                return self.create_help_screen()
-            elif args[1] == "session":
-                if user.active_vocab is None:
-                    return None
-                user_vocab = self.get_user_vocab(user_id, user.active_vocab)
-                self.active_vocabs[user_id] = user_vocab
-                user_vocab.start_session()
-                if user_vocab.session is not None:
-                    return user_vocab.session.next_question()
-                else:
-                    if user_vocab.fully_learned():
-                        return MessageBox(msg="You learned all words in this vocab! 🎉🎉🎉",
-                                          ok_cb="goto:home")
-                    else:
-                        wait = secs_to_interval(user_vocab.wait_time_sec)
-                        return MessageBox(
-                            msg=f"You need to wait {wait} before you can review this vocab.",
-                            ok_cb="goto:home")
-
-        logging.warning("Unrecognized callback: %s", callback_data)
-        return None
+    def _start_session(self, user: UserStorageInfo) -> tp.Optional[UserScreen]:
+        if user.active_vocab is None:
+            return None
+        user_vocab = self.get_user_vocab(user.id, user.active_vocab)
+        self._set_active_vocab(user.id, user_vocab)
+        user_vocab.start_session()
+        if user_vocab.session is not None:
+            return user_vocab.session.next_question()
+        elif user_vocab.fully_learned():
+            return MessageBox(msg="You learned all words in this vocab! 🎉🎉🎉",
+                              ok_cb="goto:home")
+        else:
+            wait = secs_to_interval(user_vocab.wait_time_sec)
+            return MessageBox(
+                msg=f"You need to wait {wait} before you can review this vocab.",
+                ok_cb="goto:home")
 
     def respond_default(self, user_id: int, name: str) -> UserScreen:
         """Respond to /start and arbitrary text message."""
@@ -407,5 +562,5 @@ class VocabBotEngine:
         summary = self.storage.get_vocab_summary(user.id, user.active_vocab)
         return HomeScreen(user_name=user.name, vocab_id=user.active_vocab, progress_summary=summary)
 
-    def create_help_screen(self):
-        return HelpScreen(session_size=self.session_size)
+    def create_help_screen(self) -> HelpScreen:
+        return self.help_screen
@@ -1,10 +1,12 @@
+import asyncio
 import os
 import random
 import typing as tp
 
 import pytest
 
-from .engine import VocabBotEngine, Vocab
+from .engine import VocabBotEngine, Vocab, UserVocab, LearningSession
+from .storage import VocabState
 from .user_screens import UserScreen, HomeScreen, Question, SessionSummary, VocabSelect, MessageBox
 
 
@@ -129,3 +131,107 @@ def test_learn_vocab(engine: VocabBotEngine, vocab_id: str):
     learner = AutoLearner(engine)
     learner.learn_vocab(vocab_id)
     learner.validate(engine.vocabs[vocab_id])
+
+
+def test_respond_async(engine: VocabBotEngine):
+    async def respond() -> list[tp.Optional[UserScreen]]:
+        user_id = random.randint(1000001, 2000000)
+        select = await engine.respond_default_async(user_id, "Alice")
+        assert type(select) is VocabSelect
+        return await asyncio.gather(*[
+            engine.respond_to_button_async(user_id, "select_vocab:vocab1") for _ in range(5)])
+
+    screens = asyncio.run(respond())
+    assert all(type(screen) is HomeScreen for screen in screens)
+    assert len(engine.user_locks) == 0  # Unused locks are dropped.
+
+
+def test_question_in_small_session(engine: VocabBotEngine):
+    vocab = engine.vocabs["vocab1"]
+    user_vocab = UserVocab(engine=engine, user_id=0, vocab=vocab, state=VocabState.new(1000))
+    for _ in range(100):
+        session = LearningSession(user_vocab, [7])
+        question = session.next_question()
+        assert len(question.options) == engine.variants_num
+        assert len(set(question.options)) == engine.variants_num
+        assert question.prompt in ("word7", "trans7")
+        correct = "trans7" if question.prompt == "word7" else "word7"
+        assert question.options[session.quest_correct_option] == correct
+
+
+def test_load_vocab_from_csv(tmp_path):
+    path = tmp_path / "vocab.csv"
+    with open(path, "w") as f:
+        f.write('__private_user_ids__,"1,2"\n')
+        f.write('__comment__,anything\n')
+        f.write('a,b\n')
+        f.write('c,"d, e,f,g",h\n')
+        f.write('\n')
+        f.write('"i,j",k,"l"\n')
+        f.write('m\x85n,o\u2028p\n')
+        f.write('q,r,"s\nt"\r\n')
+        f.write('u,v')
+    vocab = Vocab.load_from_csv("vocab", path)
+    assert vocab.private_user_ids == {1, 2}
+    assert vocab.foreign == ("a", "c", "i,j", "m\x85n", "q", "u")
+    assert vocab.native == ("b", "d,e,f", "k", "o\u2028p", "r", "v")
+    assert vocab.extra_info == (None, "h", "l", None, "s\nt", None)
+
+
+def test_inactive_sessions_dropped(engine: VocabBotEngine):
+    max_active_sessions = engine.max_active_sessions
+    engine.max_active_sessions = 2
+    try:
+        learners = [AutoLearner(engine) for _ in range(3)]
+        for learner in learners:
+            learner.click("Learn!")
+            assert type(learner.screen) is Question
+        assert learners[0].user_id not in engine.active_vocabs
+        assert learners[1].user_id in engine.active_vocabs
+        assert learners[2].user_id in engine.active_vocabs
+        assert engine.respond_to_button(learners[0].user_id, "ans:0") is None
+    finally:
+        engine.max_active_sessions = max_active_sessions
+
+
+@pytest.mark.parametrize('callback_data', [
+    "", "ans", "ans:1:2", "ans:x", "foo:bar", "goto:foo", "select_vocab:foo"])
+def test_bad_callback(engine: VocabBotEngine, callback_data: str):
+    learner = AutoLearner(engine)
+    assert engine.respond_to_button(learner.user_id, callback_data) is None
+
+
+def test_screen_payload_hash(engine: VocabBotEngine):
+    learner = AutoLearner(engine)
+    help1 = engine.respond_to_button(learner.user_id, "goto:help")
+    help2 = engine.respond_to_button(learner.user_id, "goto:help")
+    home = engine.respond_to_button(learner.user_id, "goto:home")
+    assert help1.payload_hash() == help2.payload_hash()
+    assert help1.payload_hash() != home.payload_hash()
+
+
+def test_load_vocab_cached(tmp_path):
+    path = tmp_path / "vocab.csv"
+    with open(path, "w") as f:
+        f.write("a,b\n")
+    vocab = Vocab.load("vocab", path)
+    assert (tmp_path / "vocab.pkl").exists()
+    cached_vocab = Vocab.load("vocab", path)
+    assert cached_vocab == vocab
+    assert cached_vocab.foreign == ("a",)
+
+    with open(path, "a") as f:
+        f.write("c,d\n")
+    assert Vocab.load("vocab", path).foreign == ("a", "c")
+
+
+def test_load_vocab_bad_cache(tmp_path):
+    path = tmp_path / "vocab.csv"
+    with open(path, "w") as f:
+        f.write("a,b\n")
+    vocab = Vocab.load("vocab", path)
+    cache_path = tmp_path / "vocab.pkl"
+    with open(cache_path, "r+b") as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b"\xff" * 10)  # Corrupts pickled vocab, but not the key.
+    assert Vocab.load("vocab", path) == vocab
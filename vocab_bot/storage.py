@@ -1,13 +1,19 @@
 import json
 import logging
 import os
+import queue
 import sqlite3
+import sys
+import threading
 import typing as tp
+import zlib
+from array import array
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
-from .utils import get_cur_time
+from .utils import get_cur_time, LruCache
 
 
 @dataclass
@@ -18,8 +24,10 @@ class UserStorageInfo:
     active_vocab: tp.Optional[str]
 
 
-@dataclass
+@dataclass(frozen=True)
 class ItemLearnState:
+    # No per-instance __dict__, which makes instances ~3x smaller.
+    __slots__ = ('box', 'next_show_time_sec')
     box: int
     next_show_time_sec: int
 
@@ -29,85 +37,308 @@ class ItemLearnState:
     @staticmethod
     def from_arr(arr: list[tp.Any]):
         assert len(arr) == 2
-        return ItemLearnState(box=arr[0], next_show_time_sec=arr[1])
+        # Fills slots directly, skipping __init__. Used to convert whole legacy states.
+        result = ItemLearnState.__new__(ItemLearnState)
+        object.__setattr__(result, 'box', arr[0])
+        object.__setattr__(result, 'next_show_time_sec', arr[1])
+        return result
 
     @staticmethod
     def new():
         return ItemLearnState(box=0, next_show_time_sec=0)
 
 
+class VocabState(tp.Sequence[ItemLearnState]):
+    """Learning state of all items in a vocab, stored column-wise.
+
+    Indexing returns a read-only copy of item's state as ItemLearnState. To modify state,
+    write to `box` and `next_show_time_sec` arrays directly.
+
+    Serialized as a BLOB: all boxes (1 byte each), then all next show times (8 bytes each),
+    little-endian. Storage keeps it zlib-compressed.
+    """
+
+    def __init__(self, box: array, next_show_time_sec: array):
+        assert box.typecode == 'B' and next_show_time_sec.typecode == 'q'
+        assert len(box) == len(next_show_time_sec)
+        self.box = box
+        self.next_show_time_sec = next_show_time_sec
+
+    def __len__(self) -> int:
+        return len(self.box)
+
+    @tp.overload
+    def __getitem__(self, idx: int) -> ItemLearnState: ...
+
+    @tp.overload
+    def __getitem__(self, idx: slice) -> list[ItemLearnState]: ...
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [ItemLearnState(box=b, next_show_time_sec=t)
+                    for b, t in zip(self.box[idx], self.next_show_time_sec[idx])]
+        return ItemLearnState(box=self.box[idx], next_show_time_sec=self.next_show_time_sec[idx])
+
+    @staticmethod
+    def new(num_items: int) -> 'VocabState':
+        return VocabState(array('B', bytes(num_items)), array('q', bytes(8 * num_items)))
+
+    @staticmethod
+    def from_items(items: tp.Iterable[ItemLearnState]) -> 'VocabState':
+        result = VocabState(array('B'), array('q'))
+        for item in items:
+            result.box.append(item.box)
+            result.next_show_time_sec.append(item.next_show_time_sec)
+        return result
+
+    def to_bytes(self) -> bytes:
+        times = self.next_show_time_sec
+        if sys.byteorder == 'big':
+            times = array('q', times)
+            times.byteswap()
+        return self.box.tobytes() + times.tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'VocabState':
+        assert len(data) % 9 == 0
+        n = len(data) // 9
+        view = memoryview(data)  # Avoids copying slices.
+        box = array('B')
+        box.frombytes(view[:n])
+        times = array('q')
+        times.frombytes(view[n:])
+        if sys.byteorder == 'big':
+            times.byteswap()
+        return VocabState(box, times)
+
+
+# Applied to every connection. WAL lets readers proceed while a write is in progress,
+# busy_timeout makes writers wait for the lock instead of failing with "database is locked".
+# journal_size_limit truncates the WAL file after checkpoints, so bursts of saves don't leave
+# it large forever.
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",  # In KiB, i.e. up to 64 MB per connection.
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA journal_size_limit=16777216",
+]
+
+
+# Queries run on every request. sqlite3 caches compiled statements by SQL text.
+SQL_GET_VOCAB_SUMMARY = "SELECT summary FROM UserVocabs WHERE user_id = ? AND vocab_id = ?"
+SQL_GET_VOCAB_SUMMARIES = "SELECT vocab_id, summary FROM UserVocabs WHERE user_id = ?"
+SQL_GET_VOCAB_STATE = "SELECT state FROM UserVocabs WHERE user_id = ? AND vocab_id = ?"
+# Upsert updates the row in place, while INSERT OR REPLACE deletes and re-inserts it.
+SQL_SAVE_VOCAB = """
+    INSERT INTO UserVocabs(user_id,vocab_id,summary,state)
+    VALUES (?,?,?,?)
+    ON CONFLICT(user_id,vocab_id) DO UPDATE SET summary=excluded.summary, state=excluded.state
+"""
+# Covering index for listing user's summaries (see db_schema.sdl). Created on open for older DBs.
+SQL_CREATE_SUMMARY_INDEX = """
+    CREATE INDEX IF NOT EXISTS UserVocabsSummary ON UserVocabs(user_id, vocab_id, summary)
+"""
+SQL_INSERT_USER = """
+    INSERT INTO Users(user_id,name,first_seen_sec)
+    VALUES (?,?,?)
+"""
+SQL_GET_USER = """
+    SELECT name,first_seen_sec,active_vocab
+    FROM Users WHERE user_id=?
+"""
+SQL_UPDATE_USER = """
+    UPDATE Users
+    SET active_vocab=?
+    WHERE user_id=?
+"""
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    # Autocommit mode: every statement is its own transaction unless BEGIN is issued explicitly.
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _encode_state(state: VocabState) -> bytes:
+    # Items learned together share times, so even fastest compression shrinks state 5-100x.
+    return zlib.compress(state.to_bytes(), 1)
+
+
+# Max number of users (and of user-vocab pairs) with vocab summaries kept in memory.
+SUMMARY_CACHE_SIZE = 10000
+# Default number of read-only connections.
+READ_POOL_SIZE = 4
+
+
 class VocabBotStorage:
-    def __init__(self, db_path: Path):
+    """SQLite-backed storage.
+
+    Writes go through a single connection guarded by a lock, reads go through a pool of
+    read-only connections, so readers are never queued behind writes.
+    """
+
+    def __init__(self, db_path: Path, read_pool_size: int = READ_POOL_SIZE):
         if not os.path.exists(db_path):
             logging.warning("DB not found, creating empty DB")
             if not os.path.exists(db_path.parent):
                 os.makedirs(db_path.parent)
-            self.conn = sqlite3.connect(db_path)
+            self.write_conn = _connect(db_path)
             with open('db_schema.sdl') as f:
                 sdl = f.read().split(";")
                 for statement in sdl:
-                    self.conn.execute(statement)
-            self.conn.commit()
+                    self.write_conn.execute(statement)
         else:
-            self.conn = sqlite3.connect(db_path)
+            self.write_conn = _connect(db_path)
             # Check that DB is valid.
             query = "SELECT COUNT(*) FROM UserVocabs"
-            result = list(self.conn.execute(query))
-            cnt = result[0][0]
+            cnt = self.write_conn.execute(query).fetchone()[0]
             logging.info("Database contains %d user-vocab entires" % cnt)
+            self._migrate_json_states()
+            self.write_conn.execute(SQL_CREATE_SUMMARY_INDEX)
+        # Reentrant, so that writes can be made inside transaction().
+        self.write_lock = threading.RLock()
+        self.read_pool_size = read_pool_size
+        self.read_pool = queue.Queue()  # type: queue.Queue[sqlite3.Connection]
+        for _ in range(read_pool_size):
+            conn = _connect(db_path)
+            conn.execute("PRAGMA query_only=1")
+            self.read_pool.put(conn)
+
+        # Summaries are small and change only in save_vocab, so they are cached in memory
+        # (written through on save, populated lazily on read).
+        self.summary_cache = LruCache(SUMMARY_CACHE_SIZE)  # type: LruCache[tuple[int, str], str]
+        # Complete {vocab_id: summary} dicts for users whose summaries were all fetched.
+        self.user_summaries = LruCache(SUMMARY_CACHE_SIZE)  # type: LruCache[int, dict[str, str]]
+
+    def _migrate_json_states(self) -> None:
+        """Converts states stored in legacy format (JSON list of [box, next_show_time_sec])."""
+        query = "SELECT user_id, vocab_id, state FROM UserVocabs WHERE typeof(state) = 'text'"
+        rows = self.write_conn.execute(query).fetchall()
+        if len(rows) == 0:
+            return
+        params = []
+        for user_id, vocab_id, data in rows:
+            items = json.loads(data)
+            assert type(items) is list
+            state = VocabState.from_items(ItemLearnState.from_arr(x) for x in items)
+            params.append((_encode_state(state), user_id, vocab_id))
+        # All rows are updated in one transaction, i.e. with one sync to disk.
+        self.write_conn.execute("BEGIN")
+        try:
+            self.write_conn.executemany(
+                "UPDATE UserVocabs SET state=? WHERE user_id=? AND vocab_id=?", params)
+            self.write_conn.execute("COMMIT")
+        except BaseException:
+            # SQLite itself rolls back on some errors.
+            if self.write_conn.in_transaction:
+                self.write_conn.execute("ROLLBACK")
+            raise
+        logging.info("Converted %d vocab states from JSON", len(params))
 
     def close(self):
-        self.conn.close()
+        with self.write_lock:
+            # Lets SQLite refresh statistics used by query planner, if they are stale.
+            self.write_conn.execute("PRAGMA optimize")
+            self.write_conn.close()
+        for _ in range(self.read_pool_size):
+            self.read_pool.get().close()
+
+    @contextmanager
+    def _reader(self) -> tp.Iterator[sqlite3.Connection]:
+        """Borrows a read-only connection from the pool."""
+        conn = self.read_pool.get()
+        try:
+            yield conn
+        finally:
+            self.read_pool.put(conn)
+
+    @contextmanager
+    def transaction(self) -> tp.Iterator[None]:
+        """Makes all writes inside it in one transaction, i.e. with one sync to disk.
+
+        Holds the write lock, so writes from other threads wait until it ends. A nested
+        transaction is part of the outer one.
+        """
+        with self.write_lock:
+            if self.write_conn.in_transaction:
+                yield
+                return
+            self.write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self.write_conn.execute("COMMIT")
+            except BaseException:
+                # Summaries were written through to caches, and may now be wrong.
+                self.summary_cache.clear()
+                self.user_summaries.clear()
+                # Also if COMMIT failed, otherwise the connection would stay in transaction.
+                # SQLite itself rolls back on some errors, then there is nothing to roll back.
+                if self.write_conn.in_transaction:
+                    self.write_conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, query: str, params: tuple[tp.Any, ...]) -> None:
+        with self.write_lock:
+            self.write_conn.execute(query, params)
 
     def get_vocab_summary(self, user_id: int, vocab_id: str) -> tp.Optional[str]:
-        query = "SELECT summary FROM UserVocabs WHERE user_id = ? AND vocab_id = ?"
-        params = (user_id, vocab_id)
-        rows = list(self.conn.execute(query, params))
-        if len(rows) == 0:
+        summary = self.summary_cache.get((user_id, vocab_id))
+        if summary is not None:
+            return summary
+        with self._reader() as conn:
+            row = conn.execute(SQL_GET_VOCAB_SUMMARY, (user_id, vocab_id)).fetchone()
+        if row is None:
             return None
-        else:
-            return rows[0][0]
+        summary = row[0]
+        self.summary_cache.put((user_id, vocab_id), summary)
+        return summary
 
     def get_vocab_summaries_for_user(self, user_id: int) -> dict[str, str]:
-        query = "SELECT vocab_id, summary FROM UserVocabs WHERE user_id = ?"
-        return {row[0]: row[1] for row in self.conn.execute(query, (user_id,))}
+        summaries = self.user_summaries.get(user_id)
+        if summaries is None:
+            with self._reader() as conn:
+                summaries = dict(conn.execute(SQL_GET_VOCAB_SUMMARIES, (user_id,)))
+            self.user_summaries.put(user_id, summaries)
+            for vocab_id, summary in summaries.items():
+                self.summary_cache.put((user_id, vocab_id), summary)
+        # Return a copy, so callers can't corrupt the cache.
+        return dict(summaries)
 
-    def load_vocab_state(
-            self, user_id: int, vocab_id: str) -> tp.Optional[list[ItemLearnState]]:
-        query = "SELECT state FROM UserVocabs WHERE user_id = ? AND vocab_id=?"
-        rows = list(self.conn.execute(query, (user_id, vocab_id)))
-        if len(rows) == 0:
+    def load_vocab_state(self, user_id: int, vocab_id: str) -> tp.Optional[VocabState]:
+        with self._reader() as conn:
+            row = conn.execute(SQL_GET_VOCAB_STATE, (user_id, vocab_id)).fetchone()
+        if row is None:
             return None
-        assert len(rows) == 1
-        state = json.loads(rows[0][0])
-        assert type(state) is list
+        state = VocabState.from_bytes(zlib.decompress(row[0]))
         assert len(state) > 0
-        return [ItemLearnState.from_arr(x) for x in state]
+        return state
 
     def save_vocab(
             self,
             user_id: int,
             vocab_id: str,
             summary: str,
-            state: list[ItemLearnState]) -> None:
-        query = """
-            INSERT OR REPLACE INTO UserVocabs(user_id,vocab_id,summary,state)
-            VALUES (?,?,?,?)
-        """
-        state_str = json.dumps([ws.to_arr() for ws in state])
-        params = (user_id, vocab_id, summary, state_str)
-        self.conn.execute(query, params)
-        self.conn.commit()
+            state: tp.Union[VocabState, list[ItemLearnState]]) -> None:
+        if not isinstance(state, VocabState):
+            state = VocabState.from_items(state)
+        params = (user_id, vocab_id, summary, _encode_state(state))
+        with self.write_lock:
+            self.write_conn.execute(SQL_SAVE_VOCAB, params)
+            self.summary_cache.put((user_id, vocab_id), summary)
+            summaries = self.user_summaries.get(user_id)
+            if summaries is not None:
+                summaries[vocab_id] = summary
 
     def insert_user(self, user_id: int, name: str) -> UserStorageInfo:
-        query = """
-            INSERT INTO Users(user_id,name,first_seen_sec)
-            VALUES (?,?,?)
-        """
         cur_time = get_cur_time()
         params = (user_id, name, get_cur_time())
-        self.conn.execute(query, params)
-        self.conn.commit()
+        self._write(SQL_INSERT_USER, params)
         return UserStorageInfo(
             id=user_id,
             name=name,
@@ -115,15 +346,10 @@ class VocabBotStorage:
             active_vocab=None)
 
     def get_user(self, user_id) -> tp.Optional[UserStorageInfo]:
-        query = """
-            SELECT name,first_seen_sec,active_vocab
-            FROM Users WHERE user_id=?
-        """
-        rows = list(self.conn.execute(query, (user_id,)))
-        if len(rows) == 0:
+        with self._reader() as conn:
+            row = conn.execute(SQL_GET_USER, (user_id,)).fetchone()
+        if row is None:
             return None
-        assert len(rows) == 1
-        row = rows[0]
         return UserStorageInfo(
             id=user_id,
             name=row[0],
@@ -131,11 +357,5 @@ class VocabBotStorage:
             active_vocab=row[2])
 
     def update_user(self, user: UserStorageInfo) -> None:
-        query = """
-            UPDATE Users
-            SET active_vocab=?
-            WHERE user_id=?
-        """
         params = (user.active_vocab, user.id)
-        self.conn.execute(query, params)
-        self.conn.commit()
+        self._write(SQL_UPDATE_USER, params)
@@ -1,9 +1,12 @@
+import dataclasses
 import os
+import sqlite3
 import typing as tp
 
 import pytest
 
-from .storage import VocabBotStorage, ItemLearnState
+from .storage import (VocabBotStorage, ItemLearnState, VocabState, SQL_GET_VOCAB_SUMMARY,
+                      SQL_GET_VOCAB_SUMMARIES, SQL_GET_VOCAB_STATE, SQL_GET_USER)
 
 
 @pytest.fixture(scope="session")
@@ -39,11 +42,11 @@ def test_update_state(storage: VocabBotStorage):
     assert storage.load_vocab_state(3, "vocab1") is None
     state1 = [ItemLearnState.from_arr([1, 2]), ItemLearnState.from_arr([3, 4])]
     storage.save_vocab(3, "vocab1", "summary1", state1)
-    assert storage.load_vocab_state(3, "vocab1") == state1
+    assert list(storage.load_vocab_state(3, "vocab1")) == state1
     state2 = [ItemLearnState.from_arr([1, 6]), ItemLearnState.from_arr([7, 8])]
     storage.save_vocab(3, "vocab1", "summary2", state2)
     assert storage.get_vocab_summaries_for_user(3) == {"vocab1": "summary2"}
-    assert storage.load_vocab_state(3, "vocab1") == state2
+    assert list(storage.load_vocab_state(3, "vocab1")) == state2
 
 
 def test_insert_user(storage: VocabBotStorage):
@@ -68,3 +71,110 @@ def test_user_set_active_vocab(storage: VocabBotStorage):
     user1.active_vocab = None
     storage.update_user(user1)
     assert storage.get_user(5).active_vocab is None
+
+
+def test_summaries_cache(storage: VocabBotStorage):
+    storage.save_vocab(6, "vocab1", "summary1", [])
+    summaries = storage.get_vocab_summaries_for_user(6)
+    assert summaries == {"vocab1": "summary1"}
+    del summaries["vocab1"]
+    storage.save_vocab(6, "vocab2", "summary2", [])
+    storage.save_vocab(6, "vocab1", "summary3", [])
+    assert storage.get_vocab_summary(6, "vocab1") == "summary3"
+    assert storage.get_vocab_summaries_for_user(6) == {"vocab1": "summary3", "vocab2": "summary2"}
+
+
+def test_migrate_json_states(tmp_path):
+    db_path = tmp_path / "tmp_db.sqlite"
+    storage = VocabBotStorage(db_path)
+    query = "INSERT INTO UserVocabs(user_id,vocab_id,summary,state) VALUES (?,?,?,?)"
+    storage.write_conn.execute(query, (1, "vocab1", "summary1", "[[1, 2], [3, 4]]"))
+    storage.write_conn.execute(query, (1, "vocab2", "summary2", "[[0, 5]]"))
+    storage.close()
+
+    storage = VocabBotStorage(db_path)
+    try:
+        assert list(storage.load_vocab_state(1, "vocab1")) == [
+            ItemLearnState.from_arr([1, 2]), ItemLearnState.from_arr([3, 4])]
+        assert list(storage.load_vocab_state(1, "vocab2")) == [ItemLearnState.from_arr([0, 5])]
+    finally:
+        storage.close()
+
+
+def test_transaction(storage: VocabBotStorage):
+    with storage.transaction():
+        storage.insert_user(20, "user20")
+        storage.save_vocab(20, "vocab1", "summary1", [ItemLearnState.new()])
+    assert storage.get_user(20).name == "user20"
+    assert storage.get_vocab_summary(20, "vocab1") == "summary1"
+
+    with pytest.raises(ValueError):
+        with storage.transaction():
+            storage.insert_user(21, "user21")
+            storage.save_vocab(21, "vocab1", "summary1", [ItemLearnState.new()])
+            raise ValueError()
+    assert storage.get_user(21) is None
+    assert storage.get_vocab_summary(21, "vocab1") is None
+    assert storage.get_vocab_summary(20, "vocab1") == "summary1"
+
+
+def test_transaction_aborted_by_sqlite(tmp_path):
+    storage = VocabBotStorage(tmp_path / "tmp_db.sqlite")
+    try:
+        storage.write_conn.execute("""
+            CREATE TRIGGER Abort BEFORE INSERT ON UserVocabs WHEN NEW.vocab_id = 'abort'
+            BEGIN SELECT RAISE(ROLLBACK, 'aborted'); END""")
+        with pytest.raises(sqlite3.IntegrityError):
+            with storage.transaction():
+                storage.save_vocab(1, "vocab1", "summary1", [ItemLearnState.new()])
+                storage.save_vocab(1, "abort", "summary2", [ItemLearnState.new()])
+        assert not storage.write_conn.in_transaction
+        assert storage.get_vocab_summary(1, "vocab1") is None
+
+        with storage.transaction():
+            storage.save_vocab(1, "vocab1", "summary1", [ItemLearnState.new()])
+        assert storage.get_vocab_summary(1, "vocab1") == "summary1"
+    finally:
+        storage.close()
+
+
+def test_vocab_state_serialization():
+    state = VocabState.new(3)
+    state.box[1] = 4
+    state.next_show_time_sec[2] = 5 * 10**9
+    restored = VocabState.from_bytes(state.to_bytes())
+    assert list(restored) == list(state)
+    assert restored[1] == ItemLearnState(box=4, next_show_time_sec=0)
+    assert restored[-1] == ItemLearnState(box=0, next_show_time_sec=5 * 10**9)
+    assert restored[1:] == [restored[1], restored[2]]
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        restored[1].box = 3  # type: ignore
+
+
+@pytest.mark.parametrize('query', [
+    SQL_GET_VOCAB_SUMMARY, SQL_GET_VOCAB_SUMMARIES, SQL_GET_VOCAB_STATE, SQL_GET_USER])
+def test_lookups_use_index(storage: VocabBotStorage, query: str):
+    params = (1,) * query.count("?")
+    plan = list(storage.write_conn.execute("EXPLAIN QUERY PLAN " + query, params))
+    assert len(plan) == 1
+    assert plan[0][3].startswith("SEARCH")
+
+
+def test_summaries_lookup_uses_covering_index(storage: VocabBotStorage):
+    query = "EXPLAIN QUERY PLAN " + SQL_GET_VOCAB_SUMMARIES
+    plan = list(storage.write_conn.execute(query, (1,)))
+    assert "COVERING INDEX UserVocabsSummary" in plan[0][3]
+
+
+def test_summary_index_created_for_old_db(tmp_path):
+    db_path = tmp_path / "tmp_db.sqlite"
+    storage = VocabBotStorage(db_path)
+    storage.write_conn.execute("DROP INDEX UserVocabsSummary")
+    storage.close()
+
+    storage = VocabBotStorage(db_path)
+    try:
+        query = "SELECT name FROM sqlite_master WHERE type = 'index' AND name = ?"
+        assert storage.write_conn.execute(query, ("UserVocabsSummary",)).fetchone() is not None
+    finally:
+        storage.close()
@@ -1,9 +1,10 @@
+import hashlib
 import typing as tp
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from functools import lru_cache
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
 class UserScreen(ABC):
@@ -25,16 +26,31 @@ class UserScreen(ABC):
         pass
 
     def get_markup(self) -> InlineKeyboardMarkup:
-        buttons = self.get_buttons()
-        mb = self.max_buttons_per_row()
-        rows = [buttons[i:i + mb] for i in range(0, len(buttons), mb)]
-        builder = InlineKeyboardBuilder()
-        for row in rows:
-            builder.row(*[InlineKeyboardButton(text=b[0], callback_data=b[1]) for b in row])
-        return builder.as_markup()
+        return _build_markup(tuple(self.get_buttons()), self.max_buttons_per_row())
 
+    def payload_hash(self) -> bytes:
+        """Hash of what user sees. Screens with equal hashes render to the same message."""
+        payload = (self.get_message_text(), tuple(self.get_buttons()), self.max_buttons_per_row())
+        return hashlib.blake2b(repr(payload).encode(), digest_size=8).digest()
 
-@dataclass
+
+@lru_cache(maxsize=1024)
+def _build_markup(buttons: tuple[tuple[str, str], ...], mb: int) -> InlineKeyboardMarkup:
+    """Builds keyboard. Result is shared by all screens with these buttons, don't modify it."""
+    n = len(buttons)
+    rows = [[_make_button(*buttons[i]) for i in range(start, min(start + mb, n))]
+            for start in range(0, n, mb)]
+    # Not using InlineKeyboardBuilder, because it deep-copies buttons.
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@lru_cache(maxsize=2048)
+def _make_button(text: str, callback_data: str) -> InlineKeyboardButton:
+    """Buttons are shared by all keyboards that have them, don't modify them."""
+    return InlineKeyboardButton(text=text, callback_data=callback_data)
+
+
+@dataclass(frozen=True)
 class Question(UserScreen):
     prev_correct: tp.Optional[bool]  # Whether previous question was answered correctly.
     prev_prompt: str
@@ -45,26 +61,20 @@ class Question(UserScreen):
 
     def get_buttons(self) -> list[tuple[str, str]]:
         # <option> - callback "ans:<option_number>".
-        buttons = [(text, "ans:%d" % i) for i, text in enumerate(self.options)]
+        buttons = [(text, f"ans:{i}") for i, text in enumerate(self.options)]
         buttons.append(("🤷 I don't know", "ans:-1"))
         return buttons
 
     def get_message_text(self) -> str:
-        text = ""
-        if self.prev_correct is not None:
-            if self.prev_correct is True:
-                text += "✅ Correct!\n"
-            else:
-                text += "❌ Wrong!\n"
-            text += "%s - <b>%s</b>\n" % (self.prev_prompt, self.prev_correct_answer)
-            if self.prev_extra_info is not None:
-                text += self.prev_extra_info + "\n"
-            text += "\n"
-        text += self.prompt
-        return text
-
-
-@dataclass
+        if self.prev_correct is None:
+            return self.prompt
+        result = "✅ Correct!" if self.prev_correct is True else "❌ Wrong!"
+        extra_info = "" if self.prev_extra_info is None else f"{self.prev_extra_info}\n"
+        return (f"{result}\n{self.prev_prompt} - <b>{self.prev_correct_answer}</b>\n"
+                f"{extra_info}\n{self.prompt}")
+
+
+@dataclass(frozen=True)
 class SessionSummary(UserScreen):
     correct_count: int
     incorrect_count: int
@@ -75,24 +85,23 @@ class SessionSummary(UserScreen):
 
     def get_message_text(self) -> str:
         total = self.correct_count + self.incorrect_count
-        text = "Session done!\n"
+        parts = ["Session done!\n"]
         if self.correct_count > 0:
-            text += "✅ %d/%d correct\n" % (self.correct_count, total)
+            parts.append(f"✅ {self.correct_count}/{total} correct\n")
         if self.incorrect_count > 0:
-            text += "❌ %d/%d wrong\n" % (self.incorrect_count, total)
-        text += "\n"
-        text += "Session summary:\n"
-        for box_change in sorted(list(self.box_move_summary.keys())):
-            text += "\t%s: %s\n" % (box_change, ','.join(self.box_move_summary[box_change]))
-        text += "\n"
+            parts.append(f"❌ {self.incorrect_count}/{total} wrong\n")
+        parts.append("\nSession summary:\n")
+        for box_change in sorted(self.box_move_summary):
+            parts.append(f"\t{box_change}: {','.join(self.box_move_summary[box_change])}\n")
+        parts.append("\n")
         if self.incorrect_count == 0:
-            text += "Great job!!! All correct!!! 🎉\n"
+            parts.append("Great job!!! All correct!!! 🎉\n")
         elif self.correct_count > self.incorrect_count:
-            text += "Good job!\n"
-        return text
+            parts.append("Good job!\n")
+        return "".join(parts)
 
 
-@dataclass
+@dataclass(frozen=True)
 class HomeScreen(UserScreen):
     user_name: str
     vocab_id: str
@@ -106,34 +115,31 @@ class HomeScreen(UserScreen):
         ]
 
     def get_message_text(self) -> str:
-        text = "👋 Hello, %s!\n" % self.user_name
-        text += "You are learning vocab %s.\n" % self.vocab_id
-        text += "Your progress is: %s\n" % self.progress_summary
-        return text
+        return (f"👋 Hello, {self.user_name}!\n"
+                f"You are learning vocab {self.vocab_id}.\n"
+                f"Your progress is: {self.progress_summary}\n")
 
 
-@dataclass
+@dataclass(frozen=True)
 class VocabSelect(UserScreen):
     vocab_ids: list[str]
     vocab_summaries: list[str]
 
     def get_buttons(self) -> list[tuple[str, str]]:
         # <index> (1-indexed) - "select_vocab:<vocab_id>"
-        return [(vocab_id, "select_vocab:%s" % vocab_id) for vocab_id in self.vocab_ids]
+        return [(vocab_id, f"select_vocab:{vocab_id}") for vocab_id in self.vocab_ids]
 
     def max_buttons_per_row(self) -> int:
         return 4
 
     def get_message_text(self) -> str:
-        text = "📚 All available vocabularies:\n"
-        for i, vocab_id in enumerate(self.vocab_ids):
-            text += f"\t{i + 1}. {vocab_id} - {self.vocab_summaries[i]}\n"
-        text += "\n"
-        text += "Click button below to select vocabulary to learn.\n"
-        return text
+        lines = "".join(f"\t{i}. {vocab_id} - {summary}\n" for i, (vocab_id, summary) in
+                        enumerate(zip(self.vocab_ids, self.vocab_summaries), 1))
+        return ("📚 All available vocabularies:\n" + lines +
+                "\nClick button below to select vocabulary to learn.\n")
 
 
-@dataclass
+@dataclass(frozen=True)
 class MessageBox(UserScreen):
     msg: str
     ok_cb: str
@@ -165,7 +171,7 @@ HELP_TEXT = '\n'.join([
 ])
 
 
-@dataclass
+@dataclass(frozen=True)
 class HelpScreen(UserScreen):
     session_size: int
 
@@ -173,4 +179,9 @@ class HelpScreen(UserScreen):
         return [("OK", "goto:home")]
 
     def get_message_text(self) -> str:
-        return HELP_TEXT % (self.session_size,)
+        return _render_help_text(self.session_size)
+
+
+@lru_cache(maxsize=None)
+def _render_help_text(session_size: int) -> str:
+    return HELP_TEXT % (session_size,)
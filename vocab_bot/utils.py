@@ -1,15 +1,57 @@
-from datetime import datetime, timezone
+import threading
+import time
+import typing as tp
+from collections import OrderedDict
 
 
 def get_cur_time() -> int:
-    return int(datetime.now(timezone.utc).timestamp())
+    return int(time.time())
 
 
 def secs_to_interval(secs: int) -> str:
+    # Rounds half up, using integer arithmetic only.
     if secs < 3600:
-        return "%d minutes" % round(secs / 60)
-    hours = round(secs / 3600)
+        return f"{(secs + 30) // 60} minutes"
+    hours = (secs + 1800) // 3600
     if hours <= 24:
-        return "%d hours" % hours
+        return f"{hours} hours"
     else:
-        return "%d days %d hours" % (hours // 24, hours % 24)
+        days, hours = divmod(hours, 24)
+        return f"{days} days {hours} hours"
+
+
+K = tp.TypeVar('K')
+V = tp.TypeVar('V')
+
+
+class LruCache(tp.Generic[K, V]):
+    """Thread-safe dict of limited size. When full, drops least recently used entries."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.data = OrderedDict()  # type: OrderedDict[K, V]
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.data
+
+    def get(self, key: K) -> tp.Optional[V]:
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
@@ -1,11 +1,28 @@
-from .utils import secs_to_interval
+from .utils import secs_to_interval, LruCache
 
 
 def test_secs_to_interval():
     assert secs_to_interval(110) == "2 minutes"
+    assert secs_to_interval(150) == "3 minutes"
     assert secs_to_interval(3599) == "60 minutes"
     assert secs_to_interval(3600) == "1 hours"
+    assert secs_to_interval(9000) == "3 hours"
     assert secs_to_interval(19 * 3600 + 200) == "19 hours"
     assert secs_to_interval(24 * 3600 + 1) == "24 hours"
     assert secs_to_interval((2 * 24 + 5) * 3600) == "2 days 5 hours"
     assert secs_to_interval((10 * 24 + 15) * 3600) == "10 days 15 hours"
+
+
+def test_lru_cache():
+    cache = LruCache(2)  # type: LruCache[str, int]
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    cache.clear()
+    assert len(cache) == 0